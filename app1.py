@@ -1,14 +1,33 @@
 import os
+import re
+import atexit
+import asyncio
+import threading
+import selectors
+import pypdfium2 as pdfium
 import tempfile
 import requests
+import httpx
 import uuid
-import re
-import json
-
-from flask import Flask, request, jsonify, render_template, session
+import orjson
+import hashlib
+import contextvars
+import redis
+import tiktoken
+import ijson
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cachetools import LRUCache, TTLCache
+from typing import Annotated
+from pydantic import BaseModel, BeforeValidator, ValidationError, model_validator
+from flask import Flask, request, jsonify, render_template, session, Response, stream_with_context
+from flask.json.provider import JSONProvider
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
-from pdfminer.high_level import extract_text
 
 # =====================================================
 # LOAD ENVIRONMENT
@@ -16,6 +35,118 @@ from pdfminer.high_level import extract_text
 load_dotenv()
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 COURTLISTENER_TOKEN = os.getenv("COURTLISTENER_TOKEN")
+SEMANTIC_CACHE_MODEL = os.getenv("SEMANTIC_CACHE_MODEL")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+REDIS_URL = os.getenv("REDIS_URL")
+CONTEXT_TTL = int(os.getenv("CONTEXT_TTL", "3600"))
+MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", "24000"))
+# Per server process; gunicorn.conf.py sets it to share the CPUs between workers
+PDF_POOL_WORKERS = int(os.getenv("PDF_POOL_WORKERS", "2"))
+
+# =====================================================
+# LLM RESPONSE CACHE
+# =====================================================
+# Exact LRU cache keyed on sha256(model + messages). The optional semantic
+# layer (enabled by SEMANTIC_CACHE_MODEL, e.g.
+# "sentence-transformers/all-MiniLM-L6-v2") also returns a cached answer
+# when the last user prompt is near-identical to a cached one sent with
+# the same model, system role and history. It only covers prompts that fit
+# the encoder's window: longer ones would be embedded from their (shared)
+# opening only, so the part that differs would be ignored. Semantic entries
+# are scoped to the user context being served (cache_scope), so a near-
+# identical message never gets another user's answer; outside a context
+# only the exact layer is used.
+
+cache_scope = contextvars.ContextVar("cache_scope", default=None)
+
+class ResponseCache:
+    def __init__(self, maxsize=1024, semantic_model=None, threshold=0.95):
+        self.exact = LRUCache(maxsize=maxsize)
+        self.semantic = LRUCache(maxsize=maxsize)  # prefix key -> deque of (vec, answer)
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.encoder = None
+
+        if semantic_model:
+            from sentence_transformers import SentenceTransformer
+            self.encoder = SentenceTransformer(semantic_model)
+
+    @staticmethod
+    def _key(model, messages):
+        return hashlib.sha256(model.encode() + orjson.dumps(messages)).hexdigest()
+
+    def _embed(self, messages):
+        """Embedding of the last prompt, or None if it would be truncated."""
+        text = messages[-1]["content"]
+        # Leave room for the [CLS] / [SEP] tokens
+        if len(self.encoder.tokenizer.tokenize(text)) > self.encoder.max_seq_length - 2:
+            return None
+        return self.encoder.encode(text, normalize_embeddings=True)
+
+    def _semantic_key(self, model, messages):
+        scope = cache_scope.get()
+        if not self.encoder or scope is None:
+            return None
+        return f"{scope}:{self._key(model, messages[:-1])}"
+
+    def _lookup(self, model, messages):
+        """Exact hit (or None) and the semantic candidates for this prefix."""
+        prefix = self._semantic_key(model, messages)
+        with self.lock:
+            hit = self.exact.get(self._key(model, messages))
+            if hit is not None or prefix is None:
+                return hit, []
+            return None, list(self.semantic.get(prefix, ()))
+
+    def _match(self, messages, entries):
+        vec = self._embed(messages)
+        if vec is None:
+            return None
+
+        best_vec, best_answer = max(entries, key=lambda e: float(e[0] @ vec))
+        if float(best_vec @ vec) > self.threshold:
+            return best_answer
+        return None
+
+    def _store(self, model, messages, answer, vec):
+        prefix = self._semantic_key(model, messages)
+        with self.lock:
+            self.exact[self._key(model, messages)] = answer
+            if vec is not None and prefix is not None:
+                if prefix not in self.semantic:
+                    self.semantic[prefix] = deque(maxlen=256)
+                self.semantic[prefix].append((vec, answer))
+
+    def get(self, model, messages):
+        hit, entries = self._lookup(model, messages)
+        if hit is not None or not entries:
+            return hit
+        return self._match(messages, entries)
+
+    def put(self, model, messages, answer):
+        vec = self._embed(messages) if self._semantic_key(model, messages) else None
+        self._store(model, messages, answer, vec)
+
+    # Async variants run the CPU-bound encode via asyncio.to_thread (a real
+    # thread under the dev server; see ASYNC RUNNER for gevent)
+
+    async def aget(self, model, messages):
+        hit, entries = self._lookup(model, messages)
+        if hit is not None or not entries:
+            return hit
+        return await asyncio.to_thread(self._match, messages, entries)
+
+    async def aput(self, model, messages, answer):
+        vec = None
+        if self._semantic_key(model, messages):
+            vec = await asyncio.to_thread(self._embed, messages)
+        self._store(model, messages, answer, vec)
+
+
+_response_cache = ResponseCache(
+    semantic_model=SEMANTIC_CACHE_MODEL,
+    threshold=SEMANTIC_CACHE_THRESHOLD
+)
 
 # =====================================================
 # OPENROUTER RAW HTTP CLIENT
@@ -25,37 +156,282 @@ class OpenRouterHTTPClient:
     def __init__(self, api_key):
         self.api_key = api_key
         self.url = "https://openrouter.ai/api/v1/chat/completions"
-
-    def chat(self, model, messages, temperature=0):
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
+        self._headers = {
+            "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
         }
+
+    def chat(self, model, messages, temperature=0, response_format=None):
+        cached = _response_cache.get(model, messages)
+        if cached is not None:
+            return cached
+
         payload = {
             "model": model,
             "messages": messages,
             "temperature": temperature
         }
+        if response_format:
+            payload["response_format"] = response_format
 
-        r = requests.post(self.url, headers=headers, json=payload)
+        r = _session.post(self.url, headers=self._headers, json=payload, timeout=60)
         r.raise_for_status()
         data = r.json()
 
-        return data["choices"][0]["message"]["content"]
+        answer = data["choices"][0]["message"]["content"]
+        _response_cache.put(model, messages, answer)
+        return answer
+
+    async def achat(self, model, messages, temperature=0, response_format=None):
+        cached = await _response_cache.aget(model, messages)
+        if cached is not None:
+            return cached
+
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature
+        }
+        if response_format:
+            payload["response_format"] = response_format
+
+        r = await _asend(_aclient.build_request("POST", self.url, headers=self._headers, json=payload))
+        r.raise_for_status()
+        data = r.json()
+
+        answer = data["choices"][0]["message"]["content"]
+        await _response_cache.aput(model, messages, answer)
+        return answer
+
+    def chat_stream(self, model, messages, temperature=0):
+        """Yield completion text pieces as OpenRouter streams them (SSE)."""
+        cached = _response_cache.get(model, messages)
+        if cached is not None:
+            yield cached
+            return
 
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": True
+        }
+
+        pieces = []
+        done = False
+        with _session.post(self.url, headers=self._headers, json=payload, timeout=60, stream=True) as r:
+            r.raise_for_status()
+            for line in r.iter_lines(decode_unicode=True):
+                # Skip keep-alive comments (": OPENROUTER PROCESSING") and blanks
+                if not line or not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):]
+                if data == "[DONE]":
+                    done = True
+                    break
+
+                event = orjson.loads(data)
+                choices = event.get("choices") or [{}]
+                # Mid-stream failures arrive as an error event, not an HTTP status
+                if "error" in event or choices[0].get("finish_reason") == "error":
+                    error = event.get("error") or {}
+                    raise RuntimeError(f"OpenRouter stream error: {error.get('message', error)}")
+
+                piece = choices[0].get("delta", {}).get("content")
+                if piece:
+                    pieces.append(piece)
+                    yield piece
+
+        # Only a complete answer may be served to later identical requests
+        if done:
+            _response_cache.put(model, messages, "".join(pieces))
+
+
+# Rate-limit / gateway statuses retried on both the sync and async clients
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Shared sync HTTP session for the drafter (/draft, /draft/stream): pooled
+# keep-alive connections + retry on rate-limit / gateway errors
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=50,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=["GET", "POST"]
+    )
+))
+
+# Shared async HTTP/2 client for the /chat pipeline (OpenRouter and
+# CourtListener): concurrent calls to one host multiplex over a single
+# TCP+TLS connection that stays open across requests
+_aclient = httpx.AsyncClient(
+    timeout=60,
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        retries=3
+    )
+)
+
+async def _asend(request, stream=False, retries=3, backoff=0.3):
+    """_aclient.send with the sync session's status retries (the transport's
+    own `retries` only covers connection errors)."""
+    for attempt in range(retries + 1):
+        r = await _aclient.send(request, stream=stream)
+        if r.status_code not in RETRY_STATUSES or attempt == retries:
+            return r
+        await r.aclose()
+        await asyncio.sleep(backoff * 2 ** attempt)
 
 # Global OpenRouter client
 client = OpenRouterHTTPClient(OPENROUTER_API_KEY)
 
 
+# =====================================================
+# ASYNC RUNNER
+# =====================================================
+# One long-lived event loop in a background thread. Flask views are sync,
+# so they hand coroutines to this loop; the shared httpx client and the
+# semaphores stay bound to a single loop for the life of the process.
+#
+# Under gunicorn's gevent worker, threading is patched: this "thread" and
+# the ones asyncio.to_thread uses are greenlets in the same OS thread.
+# to_thread then only keeps CPU-bound work (tokenizing, embedding) out of
+# the loop's own code path; while it runs, the whole worker is blocked.
+
+def _new_event_loop():
+    # Under gunicorn's gevent worker select.epoll is patched away; the plain
+    # select() selector is patched to be cooperative instead.
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched("select"):
+            return asyncio.SelectorEventLoop(selectors.SelectSelector())
+    except ImportError:
+        pass
+    return asyncio.new_event_loop()
+
+_loop = _new_event_loop()
+threading.Thread(target=_loop.run_forever, daemon=True).start()
+
+def run_async(coro):
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()
+
+# Close the HTTP/2 connections cleanly when the worker exits
+atexit.register(lambda: run_async(_aclient.aclose()))
+
+# Max concurrent scorer calls across every /chat in this worker process
+# (one shared rate limit, not per pipeline)
+_llm_semaphore = asyncio.Semaphore(10)
+
+# Condensing a large upload can mean hundreds of summarizer calls; it gets
+# its own small limit so it never holds _llm_semaphore slots
+_condense_semaphore = asyncio.Semaphore(2)
+
+
 # =====================================================
 # FLASK INIT
 # =====================================================
+
+class OrjsonProvider(JSONProvider):
+    """jsonify / request.json via orjson (the /chat cases list is large)."""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Skip the bytes -> str -> bytes round-trip of the base implementation
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS),
+            mimetype="application/json"
+        )
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev-secret")
 app.config["UPLOAD_FOLDER"] = tempfile.gettempdir()
 app.config["MAX_CONTENT_LENGTH"] = 50 * 1024 * 1024
 ALLOWED_EXTENSIONS = {"pdf"}
+ALLOWED_SUFFIXES = tuple("." + ext for ext in ALLOWED_EXTENSIONS)
+
+
+# =====================================================
+# PDF EXTRACTION
+# =====================================================
+# Text extraction is CPU-bound, so it runs in worker processes instead of
+# on the Flask request thread. pypdfium2 (PDFium, C) does the parsing.
+
+def extract_pdf_text(path):
+    pdf = pdfium.PdfDocument(path)
+    try:
+        pages = []
+        for page in pdf:
+            textpage = page.get_textpage()
+            pages.append(textpage.get_text_bounded())
+            textpage.close()
+            page.close()
+        return "\n".join(pages)
+    finally:
+        pdf.close()
+
+
+_pdf_pool = ProcessPoolExecutor(max_workers=PDF_POOL_WORKERS)
+_pdf_pool_lock = threading.Lock()
+
+def _replace_pdf_pool(broken):
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is broken:
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_POOL_WORKERS)
+    broken.shutdown(wait=False, cancel_futures=True)
+
+def run_pdf_extraction(path, timeout=60):
+    """Extract in the pool. A worker that dies (PDFium crash, OOM kill)
+    breaks the whole pool, so it is replaced before the error propagates."""
+    pool = _pdf_pool
+    try:
+        future = pool.submit(extract_pdf_text, path)
+    except BrokenProcessPool:
+        # Broke while idle: nothing of ours ran yet, retry on a fresh pool
+        _replace_pdf_pool(pool)
+        pool = _pdf_pool
+        future = pool.submit(extract_pdf_text, path)
+
+    try:
+        return future.result(timeout=timeout)
+    except BrokenProcessPool:
+        _replace_pdf_pool(pool)
+        raise
+
+
+# =====================================================
+# TOKEN BUDGET
+# =====================================================
+# cl100k_base is not every model's tokenizer, but it is close enough to
+# keep prompts under MAX_CONTEXT_TOKENS. Counts are taken once per chunk
+# when it is added to a context. Chunks over CHUNK_TOKEN_BUDGET are
+# condensed once, in the background, and the summary is stored next to
+# them, so /chat does not re-tokenize or re-summarize the document.
+#
+# get_encoding downloads the BPE file on first use unless it is already in
+# TIKTOKEN_CACHE_DIR; workers without outbound access to it need that
+# directory pre-seeded (see README).
+
+_enc = tiktoken.get_encoding("cl100k_base")
+CHUNK_TOKEN_BUDGET = MAX_CONTEXT_TOKENS // 2
+
+def count_tokens(text):
+    return len(_enc.encode(text, disallowed_special=()))
+
+def split_tokens(text, size):
+    tokens = _enc.encode(text, disallowed_special=())
+    return [_enc.decode(tokens[i:i + size]) for i in range(0, len(tokens), size)]
 
 
 # =====================================================
@@ -64,40 +440,89 @@ ALLOWED_EXTENSIONS = {"pdf"}
 
 DEFAULT_MODEL = "google/gemma-3-27b-it:free"
 
+# Prefix of the in-band error string Agent.ask* return instead of raising
+_AGENT_ERROR = re.compile(r"\[Agent \w+ Error: ")
+
 class Agent:
     """Base class for all agents."""
+    # Stateless agents answer each prompt on its own; stateful ones replay
+    # (and keep) only their last `memory_window` answers.
+    stateful = False
+    memory_window = 4
+
     def __init__(self, name, role_description, model=DEFAULT_MODEL):
         self.name = name
         self.role = role_description
         self.model = model
-        self.memory = []  # Agent-level memory (local only)
 
-    def ask(self, prompt):
+    def _messages(self, prompt, memory):
         messages = [{"role": "system", "content": self.role}]
 
-        for m in self.memory:
-            messages.append({"role": "assistant", "content": m})
+        if self.stateful:
+            for m in memory[-self.memory_window:]:
+                messages.append({"role": "assistant", "content": m})
 
         messages.append({"role": "user", "content": prompt})
+        return messages
 
+    def _remember(self, memory, answer):
+        if self.stateful:
+            memory.append(answer)
+            del memory[:-self.memory_window]
+
+    def ask(self, prompt, memory, response_format=None):
         try:
             answer = client.chat(
                 model=self.model,
-                messages=messages,
-                temperature=0
+                messages=self._messages(prompt, memory),
+                temperature=0,
+                response_format=response_format
             )
-            self.memory.append(answer)
+            self._remember(memory, answer)
             return answer
 
         except Exception as e:
             return f"[Agent {self.name} Error: {e}]"
 
+    async def aask(self, prompt, memory, response_format=None):
+        try:
+            answer = await client.achat(
+                model=self.model,
+                messages=self._messages(prompt, memory),
+                temperature=0,
+                response_format=response_format
+            )
+            self._remember(memory, answer)
+            return answer
+
+        except Exception as e:
+            return f"[Agent {self.name} Error: {e}]"
+
+    def ask_stream(self, prompt, memory):
+        pieces = []
+        try:
+            for piece in client.chat_stream(
+                model=self.model,
+                messages=self._messages(prompt, memory),
+                temperature=0
+            ):
+                pieces.append(piece)
+                yield piece
+            self._remember(memory, "".join(pieces))
+
+        except Exception as e:
+            yield f"[Agent {self.name} Error: {e}]"
+
 
 # =====================================================
 # 6 LEGAL AGENTS
 # =====================================================
 
 class ClarifierAgent(Agent):
+    # Only the last round of questions matters; the answers are in the case text
+    stateful = True
+    memory_window = 1
+
     def __init__(self):
         super().__init__(
             "clarifier",
@@ -151,6 +576,8 @@ class ScorerAgent(Agent):
         )
 
 class DrafterAgent(Agent):
+    stateful = True
+
     def __init__(self):
         super().__init__(
             "drafter",
@@ -161,6 +588,157 @@ class DrafterAgent(Agent):
         )
 
 
+# =====================================================
+# JSON EXTRACTION
+# =====================================================
+
+def _extract_json(s):
+    """Return the first balanced {...} block in an LLM reply (one linear pass)."""
+    start = s.find("{")
+    if start == -1:
+        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+
+    for i in range(start, len(s)):
+        c = s[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return s[start:i + 1]
+
+    return None
+
+
+# =====================================================
+# STRUCTURED OUTPUT SCHEMAS
+# =====================================================
+# Sent as OpenRouter response_format so compatible models are constrained
+# to valid JSON. Schemas are built once at import; replies are validated
+# with pydantic, and _extract_json only salvages models that ignore it.
+#
+# The models themselves are lenient, because models that ignore
+# response_format (the free default among them) drift: objects instead of
+# strings in lists, missing or extra keys, fractional scores. Only the
+# schema sent to OpenRouter is strict (see _strict_schema).
+
+def _as_text_list(value):
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        value = [value]
+    return [
+        item if isinstance(item, str)
+        else " ".join(str(v) for v in item.values()) if isinstance(item, dict)
+        else str(item)
+        for item in value
+    ]
+
+def _as_score(value):
+    # "87.5" / 87.5 -> 88; anything else is left for the int validator to reject
+    if isinstance(value, (int, float, str)):
+        return round(float(value))
+    return value
+
+TextList = Annotated[list[str], BeforeValidator(_as_text_list)]
+Score = Annotated[int, BeforeValidator(_as_score)]
+
+class AnalyzerSchema(BaseModel):
+    facts: TextList = []
+    jurisdictions: TextList = []
+    parties: TextList = []
+    legal_issues: TextList = []
+    causes_of_action: TextList = []
+    penal_codes: TextList = []
+
+class ScoreSchema(BaseModel):
+    score: Score
+    reason: str = ""
+
+class ScoreListSchema(BaseModel):
+    scores: list[ScoreSchema]
+
+    @model_validator(mode="before")
+    @classmethod
+    def _bare_list(cls, data):
+        return {"scores": data} if isinstance(data, list) else data
+
+
+def _strict_schema(schema):
+    """Structured-output form: every property required, no extra keys."""
+    if isinstance(schema, dict):
+        if schema.get("type") == "object" and "properties" in schema:
+            schema["additionalProperties"] = False
+            schema["required"] = list(schema["properties"])
+            for prop in schema["properties"].values():
+                prop.pop("default", None)
+        for value in schema.values():
+            _strict_schema(value)
+    elif isinstance(schema, list):
+        for value in schema:
+            _strict_schema(value)
+    return schema
+
+def _json_schema_format(name, schema):
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": name, "schema": _strict_schema(schema.model_json_schema()), "strict": True}
+    }
+
+ANALYZER_FORMAT = _json_schema_format("analyzer", AnalyzerSchema)
+SCORE_FORMAT = _json_schema_format("score", ScoreSchema)
+SCORE_LIST_FORMAT = _json_schema_format("scores", ScoreListSchema)
+
+
+def _parse_json(schema, raw):
+    try:
+        return schema.model_validate_json(raw)
+    except ValidationError:
+        return schema.model_validate_json(_extract_json(raw) or "")
+
+
+# =====================================================
+# COURTLISTENER
+# =====================================================
+# Endpoint and auth header are built once at import. Successful searches
+# are kept for an hour, keyed on the normalized query params, so a refined
+# message that yields the same keywords skips the outbound request.
+# Callers get copies: /chat writes scores into the dicts.
+
+COURTLISTENER_URL = "https://www.courtlistener.com/api/rest/v4/search/"
+COURTLISTENER_ERROR = "CourtListener error"  # title of the single result on failure
+COURTLISTENER_HEADERS = {"Authorization": f"Token {COURTLISTENER_TOKEN}"} if COURTLISTENER_TOKEN else {}
+
+_cl_cache = TTLCache(maxsize=2048, ttl=3600)
+_cl_cache_lock = threading.Lock()
+
+def _covers_keywords(query, keywords, threshold=0.6):
+    """Whether most keyword words already appear in `query` (containment,
+    not Jaccard: the prefetch query is sentences, the keywords are five words)."""
+    wq = set(re.findall(r"\w+", query.lower()))
+    wk = set(re.findall(r"\w+", keywords.lower()))
+    if not wk:
+        return False
+    return len(wk & wq) / len(wk) >= threshold
+
+def _cl_cache_key(params):
+    q = " ".join(str(params.get("q", "")).lower().split())
+    return tuple(sorted({**params, "q": q}.items()))
+
+
 # =====================================================
 # ORCHESTRATOR — SAME AS ORIGINAL PIPELINE
 # =====================================================
@@ -175,37 +753,52 @@ class LegalOrchestrator:
         self.drafter = DrafterAgent()
 
     # Step 1 — Clarify
-    def clarify(self, text):
-        return self.clarifier.ask(f"Case description:\n{text}")
+    async def clarify(self, text, memory):
+        return await self.clarifier.aask(f"Case description:\n{text}", memory["clarifier"])
 
     # Step 2 — Structured extraction
-    def analyze(self, text):
-        raw = self.analyzer.ask(text)
+    async def analyze(self, text, memory):
+        raw = await self.analyzer.aask(text, memory["analyzer"], ANALYZER_FORMAT)
         try:
-            return json.loads(re.search(r"\{.*\}", raw, re.S).group(0))
-        except:
+            return _parse_json(AnalyzerSchema, raw).model_dump()
+        except ValidationError:
             return {
                 "facts": [], "jurisdictions": [], "parties": [],
                 "legal_issues": [], "causes_of_action": [], "penal_codes": []
             }
 
     # Step 3 — Summarize
-    def summarize(self, text):
-        return self.summarizer.ask(text)
+    async def summarize(self, text, memory):
+        return await self.summarizer.aask(text, memory["summarizer"])
+
+    # Map-reduce over-budget text: summarize parts in parallel, then the summaries
+    async def condense(self, text, max_tokens=CHUNK_TOKEN_BUDGET):
+        chunks = await asyncio.to_thread(split_tokens, text, max_tokens)
+        if len(chunks) <= 1:
+            return text
+
+        async def summarize_part(part):
+            async with _condense_semaphore:
+                answer = await self.summarizer.aask(
+                    f"Summarize this part of a longer legal document, keeping every "
+                    f"fact, party, date and legal issue:\n{part}",
+                    []
+                )
+            # aask reports failures in-band; never let one become case text
+            if _AGENT_ERROR.match(answer):
+                raise RuntimeError(answer)
+            return answer
+
+        parts = await asyncio.gather(*[summarize_part(c) for c in chunks])
+        return await self.condense("\n\n".join(parts), max_tokens)
 
     # Step 4 — 5 keywords
-    def generate_query(self, summary, analysis):
-        prompt = f"Summary:\n{summary}\nAnalysis:\n{json.dumps(analysis)}"
-        return self.query.ask(prompt)
+    async def generate_query(self, summary, analysis, memory):
+        prompt = f"Summary:\n{summary}\nAnalysis:\n{orjson.dumps(analysis).decode()}"
+        return await self.query.aask(prompt, memory["query_generator"])
 
     # Step 5 — CourtListener search
-    def courtlistener_search(self, keywords):
-        url = "https://www.courtlistener.com/api/rest/v4/search/"
-        headers = {}
-
-        if COURTLISTENER_TOKEN:
-            headers["Authorization"] = f"Token {COURTLISTENER_TOKEN}"
-
+    async def courtlistener_search(self, keywords):
         def _build_params(keywords, page=1, page_size=10, court=None, court_id=None,
                           start_date=None, end_date=None, extra_filters=None):
             params = {
@@ -242,34 +835,62 @@ class LegalOrchestrator:
         else:
             params = _build_params(keywords)
 
-        try:
-            r = requests.get(url, params=params, headers=headers, timeout=20)
-            r.raise_for_status()
-            data = r.json()
-        except requests.exceptions.RequestException as e:
-            return [{"title": "CourtListener error", "snippet": str(e), "pdf_link": "", "citation": "", "decision_date": ""}]
+        key = _cl_cache_key(params)
+        with _cl_cache_lock:
+            cached = _cl_cache.get(key)
+        if cached is not None:
+            return [dict(c) for c in cached]
 
+        # Stream the body and build results as items arrive instead of
+        # buffering the whole page into a dict first
         results = []
-        for item in data.get("results", []):
-            title = item.get("caseName") or item.get("name") or "Untitled"
-            citation = item.get("citation", "")
-            pdf_link = item.get("absolute_url", "")
-
-            if pdf_link.startswith("/"):
-                pdf_link = "https://www.courtlistener.com" + pdf_link
-
-            results.append({
-                "title": title,
-                "citation": citation,
-                "snippet": item.get("snippet", ""),
-                "pdf_link": pdf_link,
-                "decision_date": item.get("decision_date", "")
-            })
-
-        return results
+        items = ijson.sendable_list()
+        parser = ijson.items_coro(items, "results.item", use_float=True)
+        try:
+            request = _aclient.build_request(
+                "GET", COURTLISTENER_URL, params=params, headers=COURTLISTENER_HEADERS, timeout=20
+            )
+            r = await _asend(request, stream=True)
+            try:
+                r.raise_for_status()
+
+                async for chunk in r.aiter_bytes():
+                    parser.send(chunk)
+                    for item in items:
+                        title = item.get("caseName") or item.get("name") or "Untitled"
+                        citation = item.get("citation", "")
+                        pdf_link = item.get("absolute_url", "")
+
+                        if pdf_link.startswith("/"):
+                            pdf_link = "https://www.courtlistener.com" + pdf_link
+
+                        results.append({
+                            "title": title,
+                            "citation": citation,
+                            "snippet": item.get("snippet", ""),
+                            "pdf_link": pdf_link,
+                            "decision_date": item.get("decision_date", "")
+                        })
+                    del items[:]
+
+                    if len(results) >= params["page_size"]:
+                        del results[params["page_size"]:]
+                        break
+                else:
+                    # Whole body read: raises on a truncated or malformed
+                    # page instead of caching partial results
+                    parser.close()
+            finally:
+                await r.aclose()
+        except (httpx.HTTPError, ijson.JSONError) as e:
+            return [{"title": COURTLISTENER_ERROR, "snippet": str(e), "pdf_link": "", "citation": "", "decision_date": ""}]
+
+        with _cl_cache_lock:
+            _cl_cache[key] = results
+        return [dict(c) for c in results]
 
     # Step 6 — Scoring
-    def score_case(self, summary, case):
+    async def score_case(self, summary, case, memory):
         prompt = f"""
 Summary:
 {summary}
@@ -279,25 +900,302 @@ Snippet: {case['snippet']}
 
 Return JSON.
 """
-        raw = self.scorer.ask(prompt)
+        async with _llm_semaphore:
+            raw = await self.scorer.aask(prompt, memory["scorer"], SCORE_FORMAT)
         try:
-            parsed = json.loads(re.search(r"\{.*\}", raw, re.S).group(0))
-            parsed["score"] = max(0, min(100, int(parsed["score"])))
-            return parsed
-        except:
+            parsed = _parse_json(ScoreSchema, raw)
+            return {"score": max(0, min(100, parsed.score)), "reason": parsed.reason}
+        except ValidationError:
             return {"score": 50, "reason": "Parsing error"}
 
+    async def score_all(self, summary, cases, memory):
+        return await asyncio.gather(*[self.score_case(summary, c, memory) for c in cases])
+
+    async def score_cases(self, summary, cases, memory):
+        """Score every case in one scorer call; per-case calls if the reply is unusable."""
+        if not cases:
+            return []
+
+        listing = "\n".join(
+            f"{i}) Case Title: {c['title']}\n   Snippet: {c['snippet']}"
+            for i, c in enumerate(cases, 1)
+        )
+        prompt = f"""
+Summary:
+{summary}
+
+Cases:
+{listing}
+
+Return JSON with one score per case, in the same order:
+{{"scores": [{{"score": <0-100>, "reason": "<1 sentence>"}}, ...]}}
+"""
+        async with _llm_semaphore:
+            raw = await self.scorer.aask(prompt, memory["scorer"], SCORE_LIST_FORMAT)
+        try:
+            parsed = _parse_json(ScoreListSchema, raw).scores
+        except ValidationError:
+            parsed = []
+
+        if len(parsed) != len(cases):
+            return await self.score_all(summary, cases, memory)
+
+        return [{"score": max(0, min(100, p.score)), "reason": p.reason} for p in parsed]
+
     # Step 7 — Draft memo/brief
-    def draft_document(self, context, doc_type="memo"):
-        prompt = f"Draft a {doc_type} using:\n{json.dumps(context, indent=2)}"
-        return self.drafter.ask(prompt)
+    def draft_document(self, context, memory, doc_type="memo"):
+        prompt = f"Draft a {doc_type} using:\n{orjson.dumps(context, option=orjson.OPT_INDENT_2).decode()}"
+        return self.drafter.ask(prompt, memory["drafter"])
+
+    def draft_document_stream(self, context, memory, doc_type="memo"):
+        prompt = f"Draft a {doc_type} using:\n{orjson.dumps(context, option=orjson.OPT_INDENT_2).decode()}"
+        return self.drafter.ask_stream(prompt, memory["drafter"])
+
+
+# Agents hold no per-user state, so one orchestrator serves every request
+_orchestrator = LegalOrchestrator()
 
 
 # =====================================================
 # CONTEXT MGMT
 # =====================================================
 
-user_contexts = {}
+# User contexts live in Redis (shared by every gunicorn worker, survive
+# restarts, expire after CONTEXT_TTL seconds of inactivity). Without
+# REDIS_URL they fall back to a bounded in-process TTL cache for local dev.
+#
+# Requests never write a whole context back: chunks, their token counts
+# and queries are Redis lists (RPUSH), and analysis / summary / cases and
+# each agent's memory are separate hash fields. A /chat that runs for
+# 30 s therefore cannot overwrite an /upload or /draft that finished
+# meanwhile, and adding a message does not re-send the PDF text.
+
+class ContextStore:
+    LISTS = ("chunks", "chunk_tokens", "condensed", "condensed_tokens", "queries")
+
+    def __init__(self, url=None, ttl=3600):
+        self.ttl = ttl
+        self.redis = None
+        self.local = None
+        self.lock = threading.Lock()
+
+        if url:
+            pool = redis.ConnectionPool.from_url(url, max_connections=50, decode_responses=True)
+            self.redis = redis.Redis(connection_pool=pool)
+        else:
+            self.local = TTLCache(maxsize=1024, ttl=ttl)
+
+    @staticmethod
+    def _keys(context_id):
+        base = f"ctx:{context_id}"
+        return base, {name: f"{base}:{name}" for name in ContextStore.LISTS}
+
+    def _local_ctx(self, context_id):
+        # Caller holds self.lock; re-inserting refreshes the TTL
+        ctx = self.local.get(context_id)
+        if ctx is None:
+            ctx = new_context()
+        self.local[context_id] = ctx
+        return ctx
+
+    def _write(self, context_id, ops):
+        """Run ops(pipe, hash_key, list_keys) in one MULTI and refresh every TTL."""
+        key, lists = self._keys(context_id)
+        pipe = self.redis.pipeline()
+        ops(pipe, key, lists)
+        for k in (key, *lists.values()):
+            pipe.expire(k, self.ttl)
+        return pipe.execute()
+
+    def get(self, context_id):
+        if self.redis is None:
+            with self.lock:
+                return self.local.get(context_id)
+
+        key, lists = self._keys(context_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hgetall(key)
+        for k in lists.values():
+            pipe.lrange(k, 0, -1)
+        fields, chunks, chunk_tokens, condensed, condensed_tokens, queries = pipe.execute()
+
+        if not fields and not chunks:
+            return None
+
+        ctx = new_context()
+        for name, raw in fields.items():
+            if name.startswith("memory:"):
+                ctx["memory"][name[len("memory:"):]] = orjson.loads(raw)
+            else:
+                ctx[name] = orjson.loads(raw)
+        ctx["chunks"] = chunks
+        ctx["chunk_tokens"] = [int(n) for n in chunk_tokens]
+        ctx["condensed"] = condensed
+        ctx["condensed_tokens"] = [int(n) for n in condensed_tokens]
+        ctx["queries"] = queries
+        return ctx
+
+    def get_or_create(self, context_id):
+        if self.redis is None:
+            with self.lock:
+                return self._local_ctx(context_id)
+
+        return self.get(context_id) or new_context()
+
+    def add_chunk(self, context_id, text, tokens, condensed="", condensed_tokens=0):
+        values = {
+            "chunks": text,
+            "chunk_tokens": tokens,
+            "condensed": condensed,
+            "condensed_tokens": condensed_tokens
+        }
+        if self.redis is None:
+            with self.lock:
+                ctx = self._local_ctx(context_id)
+                for name, value in values.items():
+                    ctx[name].append(value)
+                return len(ctx["chunks"]) - 1
+
+        def ops(pipe, key, lists):
+            for name, value in values.items():
+                pipe.rpush(lists[name], value)
+        # RPUSH replies with the new length; return the chunk's index
+        return self._write(context_id, ops)[0] - 1
+
+    def set_condensed(self, context_id, index, condensed, condensed_tokens):
+        if self.redis is None:
+            with self.lock:
+                ctx = self._local_ctx(context_id)
+                ctx["condensed"][index] = condensed
+                ctx["condensed_tokens"][index] = condensed_tokens
+            return
+
+        def ops(pipe, key, lists):
+            pipe.lset(lists["condensed"], index, condensed)
+            pipe.lset(lists["condensed_tokens"], index, condensed_tokens)
+        try:
+            self._write(context_id, ops)
+        except redis.ResponseError:
+            pass  # context expired meanwhile
+
+    def add_query(self, context_id, query):
+        if self.redis is None:
+            with self.lock:
+                self._local_ctx(context_id)["queries"].append(query)
+            return
+
+        self._write(context_id, lambda pipe, key, lists: pipe.rpush(lists["queries"], query))
+
+    def update(self, context_id, **fields):
+        """Set top-level fields (analysis, summary, cases)."""
+        if self.redis is None:
+            with self.lock:
+                self._local_ctx(context_id).update(fields)
+            return
+
+        mapping = {name: orjson.dumps(value) for name, value in fields.items()}
+        self._write(context_id, lambda pipe, key, lists: pipe.hset(key, mapping=mapping))
+
+    def save_memory(self, context_id, agent, answers):
+        if self.redis is None:
+            with self.lock:
+                self._local_ctx(context_id)["memory"][agent] = answers
+            return
+
+        self._write(
+            context_id,
+            lambda pipe, key, lists: pipe.hset(key, f"memory:{agent}", orjson.dumps(answers))
+        )
+
+
+def new_memory():
+    """Per-context agent memory: agent name -> list of past answers."""
+    return {
+        name: [] for name in
+        ("clarifier", "analyzer", "summarizer", "query_generator", "scorer", "drafter")
+    }
+
+def new_context():
+    return {
+        "chunks": [],
+        "chunk_tokens": [],
+        "condensed": [],          # per chunk: its summary if over CHUNK_TOKEN_BUDGET, else ""
+        "condensed_tokens": [],
+        "analysis": {},
+        "summary": "",
+        "cases": [],
+        "queries": [],
+        "memory": new_memory()
+    }
+
+def context_text(ctx):
+    """Uploaded PDFs and messages so far, joined once per use."""
+    return "\n\n".join(ctx["chunks"])
+
+def prompt_text(ctx, max_tokens=MAX_CONTEXT_TOKENS):
+    """Case text for the agents, within max_tokens, from stored counts only.
+
+    Over budget, oversized chunks are swapped for their stored summaries
+    and the newest parts that fit are kept (a chunk whose summary is still
+    missing is skipped rather than sent whole).
+    """
+    if sum(ctx["chunk_tokens"]) <= max_tokens:
+        return context_text(ctx)
+
+    parts, used = [], 0
+    for chunk, tokens, condensed, condensed_tokens in reversed(list(zip(
+        ctx["chunks"], ctx["chunk_tokens"], ctx["condensed"], ctx["condensed_tokens"]
+    ))):
+        if condensed:
+            chunk, tokens = condensed, condensed_tokens
+        if used + tokens > max_tokens:
+            continue
+        parts.append(chunk)
+        used += tokens
+
+    return "\n\n".join(reversed(parts))
+
+INTERNAL_FIELDS = ("memory", "chunks", "chunk_tokens", "condensed", "condensed_tokens")
+
+def draft_context(ctx):
+    context = {k: v for k, v in ctx.items() if k not in INTERNAL_FIELDS}
+    context["text"] = prompt_text(ctx)
+    return context
+
+user_contexts = ContextStore(REDIS_URL, ttl=CONTEXT_TTL)
+
+def condense_chunk(context_id, index, text):
+    """Store the summary of an oversized chunk; on failure leave it unset so
+    the next /chat retries (see ensure_condensed)."""
+    try:
+        condensed = run_async(_orchestrator.condense(text))
+    except Exception as e:
+        print(f"[condense] context {context_id} chunk {index}: {e}")
+        return False
+    user_contexts.set_condensed(context_id, index, condensed, count_tokens(condensed))
+    return True
+
+def add_text(context_id, text, background=True):
+    """Append an upload or message; an oversized one is condensed in the
+    background so the request returns without waiting for the summaries."""
+    tokens = count_tokens(text)
+    index = user_contexts.add_chunk(context_id, text, tokens)
+    if background and tokens > CHUNK_TOKEN_BUDGET:
+        threading.Thread(target=condense_chunk, args=(context_id, index, text), daemon=True).start()
+
+def ensure_condensed(context_id, ctx):
+    """Condense (now) any oversized chunk still missing its summary, if the
+    case text is over budget. Returns whether the context changed."""
+    if sum(ctx["chunk_tokens"]) <= MAX_CONTEXT_TOKENS:
+        return False
+
+    changed = False
+    for index, (chunk, tokens, condensed) in enumerate(
+        zip(ctx["chunks"], ctx["chunk_tokens"], ctx["condensed"])
+    ):
+        if tokens > CHUNK_TOKEN_BUDGET and not condensed:
+            changed |= condense_chunk(context_id, index, chunk)
+    return changed
 
 def get_context_id():
     if "context_id" not in session:
@@ -318,7 +1216,14 @@ def index():
 # PDF UPLOAD
 # -----------------------------------------------------
 def allowed_file(fname):
-    return "." in fname and fname.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+    return fname.lower().endswith(ALLOWED_SUFFIXES)
+
+
+def is_pdf(stream):
+    """Check the %PDF magic bytes instead of trusting the extension."""
+    head = stream.read(4)
+    stream.seek(0)
+    return head == b"%PDF"
 
 
 @app.route("/upload", methods=["POST"])
@@ -331,7 +1236,7 @@ def upload():
     if f.filename == "":
         return jsonify({"error": "No file selected"}), 400
 
-    if not allowed_file(f.filename):
+    if not allowed_file(f.filename) or not is_pdf(f.stream):
         return jsonify({"error": "Invalid file type"}), 400
 
     fname = secure_filename(f.filename)
@@ -339,22 +1244,14 @@ def upload():
     f.save(path)
 
     try:
-        pdf_text = extract_text(path)
+        pdf_text = run_pdf_extraction(path)
         if not pdf_text.strip():
             pdf_text = f"[PDF {fname} uploaded but no extractable text]"
     except Exception as e:
         pdf_text = f"[PDF parsing error: {e}]"
 
     context_id = get_context_id()
-    ctx = user_contexts.setdefault(context_id, {
-        "text": "",
-        "analysis": {},
-        "summary": "",
-        "cases": [],
-        "queries": []
-    })
-
-    ctx["text"] += "\n\n" + pdf_text
+    add_text(context_id, pdf_text)
 
     return jsonify({
         "status": "uploaded",
@@ -374,61 +1271,90 @@ def chat():
         return jsonify({"error": "empty message"}), 400
 
     context_id = get_context_id()
-    ctx = user_contexts.setdefault(context_id, {
-        "text": "",
-        "analysis": {},
-        "summary": "",
-        "cases": [],
-        "queries": []
-    })
+    # /chat needs the summaries now, so ensure_condensed does it inline
+    add_text(context_id, message, background=False)
+    ctx = user_contexts.get_or_create(context_id)
+    if ensure_condensed(context_id, ctx):
+        ctx = user_contexts.get_or_create(context_id)
+
+    result = run_async(_run_pipeline(ctx, context_id))
+
+    # Write back only what the pipeline produced
+    user_contexts.save_memory(context_id, "clarifier", ctx["memory"]["clarifier"])
+    if result["status"] == "results":
+        user_contexts.update(
+            context_id,
+            analysis=result["analysis"],
+            summary=result["summary"],
+            cases=result["cases"]
+        )
+        user_contexts.add_query(context_id, result["keywords"])
 
-    ctx["text"] += "\n\n" + message
+    return jsonify(result)
 
-    orchestrator = LegalOrchestrator()
+
+async def _run_pipeline(ctx, context_id):
+    cache_scope.set(context_id)
+    memory = ctx["memory"]
+    text = prompt_text(ctx)
 
     # STEP 1 — Clarify
-    clarification = orchestrator.clarify(ctx["text"])
+    clarification = await _orchestrator.clarify(text, memory)
     if "NO QUESTIONS NEEDED" not in clarification.upper():
-        return jsonify({
+        return {
             "status": "clarifying",
             "questions": clarification.split("\n"),
             "context_id": context_id
-        })
+        }
 
-    # STEP 2 — Analyze
-    analysis = orchestrator.analyze(ctx["text"])
-    ctx["analysis"] = analysis
+    # STEP 2 + 3 — Analyze and summarize (independent, run together). As
+    # soon as the analysis lands, prefetch CourtListener on its legal issues
+    # so that round-trip overlaps the summarizer and keyword calls.
+    summary_task = asyncio.create_task(_orchestrator.summarize(text, memory))
+    analysis = await _orchestrator.analyze(text, memory)
 
-    # STEP 3 — Summarize
-    summary = orchestrator.summarize(ctx["text"])
-    ctx["summary"] = summary
+    prefetch_query = " ".join(analysis["legal_issues"][:3])
+    prefetch = None
+    if prefetch_query:
+        prefetch = asyncio.create_task(_orchestrator.courtlistener_search(prefetch_query))
 
-    # STEP 4 — Keywords
-    keywords = orchestrator.generate_query(summary, analysis)
-    ctx["queries"].append(keywords)
+    summary = await summary_task
 
-    # STEP 5 — CourtListener search
-    cases = orchestrator.courtlistener_search(keywords)
+    # STEP 4 — Keywords
+    keywords = await _orchestrator.generate_query(summary, analysis, memory)
+
+    # STEP 5 — CourtListener search: reuse the prefetch unless the refined
+    # keywords ask for something materially different. The prefetch query
+    # ANDs more terms, so it can come back empty; then search the keywords.
+    query, cases = keywords, None
+    if prefetch and _covers_keywords(prefetch_query, keywords):
+        prefetched = await prefetch
+        if prefetched and prefetched[0]["title"] != COURTLISTENER_ERROR:
+            query, cases = prefetch_query, prefetched
+    elif prefetch:
+        prefetch.cancel()
+
+    if cases is None:
+        cases = await _orchestrator.courtlistener_search(keywords)
 
     # STEP 6 — Score
     scored = []
-    for c in cases:
-        result = orchestrator.score_case(summary, c)
+    results = await _orchestrator.score_cases(summary, cases, memory)
+    for c, result in zip(cases, results):
         c["relevance_score"] = result["score"]
         c["relevance_reason"] = result["reason"]
         scored.append(c)
 
     scored.sort(key=lambda x: x["relevance_score"], reverse=True)
-    ctx["cases"] = scored
 
-    return jsonify({
+    return {
         "status": "results",
         "summary": summary,
         "analysis": analysis,
         "cases": scored,
-        "keywords": keywords,
+        "keywords": query,
         "context_id": context_id
-    })
+    }
 
 
 # -----------------------------------------------------
@@ -443,8 +1369,10 @@ def draft():
     if not ctx:
         return jsonify({"error": "Context not found"}), 404
 
-    orchestrator = LegalOrchestrator()
-    document = orchestrator.draft_document(ctx, doc_type)
+    context = draft_context(ctx)
+    cache_scope.set(context_id)
+    document = _orchestrator.draft_document(context, ctx["memory"], doc_type)
+    user_contexts.save_memory(context_id, "drafter", ctx["memory"]["drafter"])
 
     return jsonify({
         "status": "success",
@@ -453,21 +1381,52 @@ def draft():
     })
 
 
+@app.route("/draft/stream", methods=["POST"])
+def draft_stream():
+    context_id = request.json.get("context_id")
+    doc_type = request.json.get("doc_type", "memo")
+
+    ctx = user_contexts.get(context_id)
+    if not ctx:
+        return jsonify({"error": "Context not found"}), 404
+
+    context = draft_context(ctx)
+
+    def events():
+        cache_scope.set(context_id)
+        # One SSE event per streamed piece; werkzeug flushes each yield
+        for piece in _orchestrator.draft_document_stream(context, ctx["memory"], doc_type):
+            yield f"data: {orjson.dumps({'delta': piece}).decode()}\n\n"
+        user_contexts.save_memory(context_id, "drafter", ctx["memory"]["drafter"])
+        yield "data: [DONE]\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # -----------------------------------------------------
 # GET CONTEXT
 # -----------------------------------------------------
 @app.route("/context", methods=["GET"])
 def context():
     context_id = get_context_id()
+    ctx = user_contexts.get(context_id) or {}
     return jsonify({
         "context_id": context_id,
-        "context": user_contexts.get(context_id, {})
+        "context": {k: v for k, v in ctx.items() if k not in INTERNAL_FIELDS}
     })
 
 
 # =====================================================
-# RUN SERVER
+# RUN SERVER (development only — use gunicorn.conf.py in production)
 # =====================================================
 if __name__ == "__main__":
     print("\n🎯 AI Legal Multi-Agent Assistant running…")
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    app.run(
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "5000")),
+        debug=os.getenv("DEBUG", "True").lower() == "true"
+    )
@@ -0,0 +1,33 @@
+# Gunicorn config for the OpenRouter app (app1.py)
+#
+#   gunicorn -c gunicorn.conf.py app1:app
+#
+# gevent workers: each request runs in a greenlet. Gunicorn's gevent
+# worker monkey-patches socket/ssl/threading/select on start (before app1
+# is imported). /chat hands its pipeline to app1's background asyncio loop,
+# which talks to OpenRouter and CourtListener over httpx; the view's
+# greenlet just waits for the result, so other requests keep being served.
+# The drafter endpoints use the shared requests.Session, whose calls yield
+# the same way.
+#
+# With threading patched, every "thread" (the asyncio loop's and the ones
+# asyncio.to_thread uses) is a greenlet in the worker's one OS thread, so
+# CPU-bound work such as tokenizing or embedding blocks the whole worker
+# while it runs. Only PDF extraction runs in separate processes.
+
+import multiprocessing
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5000')}"
+
+worker_class = "gevent"
+workers = multiprocessing.cpu_count() * 2 + 1
+worker_connections = 1000
+keepalive = 65
+
+# Every worker forks its own PDF extraction pool; size it so all workers
+# together use about one process per CPU rather than CPU per worker.
+# Read by app1 at import (workers inherit the master's environment).
+os.environ.setdefault(
+    "PDF_POOL_WORKERS", str(max(1, multiprocessing.cpu_count() // workers))
+)